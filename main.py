@@ -3,8 +3,9 @@ import random
 import logging
 import secrets
 import json
-from threading import Thread
-from datetime import datetime
+import time
+from threading import Thread, Lock
+from datetime import datetime, date, timedelta
 
 from flask import Flask, request, jsonify, render_template, session, redirect
 from tinydb import TinyDB, Query
@@ -13,6 +14,8 @@ import psycopg2.extras
 from openai import OpenAI
 from google import genai
 
+from scheduler import Scheduler, LeaderElector, IntervalTrigger, CronTrigger
+
 # CONFIG & SECRETS (Optimized for Render)
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
@@ -22,6 +25,10 @@ TG_TOKEN = os.environ.get("TG_TOKEN")
 OWNER_ID = int(os.environ.get("OWNER_ID", "0"))
 WEB_PASSWORD = os.environ.get("WEB_PASSWORD", "love u")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin")
+MESSAGE_PARTITIONS = int(os.environ.get("MESSAGE_PARTITIONS", "16"))
+MESSAGE_RETENTION_DAYS = int(os.environ.get("MESSAGE_RETENTION_DAYS", "0"))  # 0 keeps messages forever
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+DIARY_LINES_BATCH = int(os.environ.get("DIARY_LINES_BATCH", "50"))  # provider calls per diary_lines run
 
 # Replit Specific Gemini Fallback
 REPLIT_GEMINI_KEY = os.environ.get("AI_INTEGRATIONS_GEMINI_API_KEY")
@@ -65,6 +72,10 @@ logging.basicConfig(level=logging.INFO)
 db = TinyDB('db.json')
 Users = Query()
 os.makedirs('static/music', exist_ok=True)
+MUSIC_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.ogg')
+
+def list_music_files():
+    return [f for f in os.listdir('static/music') if f.endswith(MUSIC_EXTENSIONS)]
 
 # MEMORY.JSON SETUP (Admin Instructions - Preferred over Database)
 def load_memory():
@@ -106,11 +117,199 @@ def sync_memory_to_db():
             )
             conn.commit()
         logging.info("Memory synced to database successfully")
+        return True
     except Exception as e:
         logging.error(f"Failed to sync memory to database: {e}")
+        return False
     finally:
         conn.close()
 
+# STATS COUNTERS
+# Materialised (metric, bucket) -> value rows kept current by each write, so the
+# admin overview never has to scan messages, diary notes or submissions.
+# Postgres counters change inside the same transaction as the data they count;
+# the TinyDB mirror changes alongside the TinyDB backup write, so each store's
+# counters always describe that store's own rows.
+STATS_SHARDS = 16
+_stats_lock = Lock()
+
+def stats_shard(bucket, user_id):
+    """Spread a cross-user counter over shards keyed by user, so concurrent chats don't upsert one hot row"""
+    return f"{bucket}#{user_id % STATS_SHARDS}"
+
+def _write_stats(rows, cur=None, increment=True):
+    # One statement may not upsert the same (metric, bucket) twice, so merge duplicates first
+    merged = {}
+    for metric, bucket, value in rows:
+        key = (metric, str(bucket))
+        merged[key] = merged.get(key, 0) + value if increment else value
+    rows = [(metric, bucket, value) for (metric, bucket), value in merged.items()]
+    if not rows: return
+    if cur:
+        op = "stats_counters.value + EXCLUDED.value" if increment else "EXCLUDED.value"
+        psycopg2.extras.execute_values(
+            cur,
+            f"INSERT INTO stats_counters (metric, bucket, value) VALUES %s ON CONFLICT (metric, bucket) DO UPDATE SET value = {op}",
+            [(m, str(b), v) for m, b, v in rows]
+        )
+        return
+    try:
+        with _stats_lock:
+            table = db.table('stats')
+            for metric, bucket, value in rows:
+                cond = (Query().metric == metric) & (Query().bucket == str(bucket))
+                if increment:
+                    row = table.get(cond)
+                    value += row['value'] if row else 0
+                table.upsert({'metric': metric, 'bucket': str(bucket), 'value': value}, cond)
+    except Exception as e:
+        logging.error(f"TinyDB stats backup error: {e}")
+
+def bump_stats(rows, cur=None):
+    """Add (metric, bucket, delta) rows: to Postgres in the caller's transaction when cur is given, else to TinyDB"""
+    _write_stats(rows, cur, increment=True)
+
+def set_stats(rows, cur=None):
+    """Overwrite (metric, bucket, value) rows"""
+    _write_stats(rows, cur, increment=False)
+
+def message_stats(user_id, groups, sign=1):
+    """Counter rows for messages grouped as (day, provider, count)"""
+    rows = []
+    total = 0
+    for day, provider, count in groups:
+        rows.append(("messages_by_day", stats_shard(day, user_id), sign * count))
+        rows.append(("messages_by_provider", stats_shard(provider or "unknown", user_id), sign * count))
+        total += count
+    rows.append(("messages_by_user", user_id, sign * total))
+    return rows
+
+def drop_user_stats(user_id, cur=None):
+    """Forget the per-user counters of a deleted user"""
+    metrics = ('messages_by_user', 'diary_notes')
+    if cur:
+        cur.execute("DELETE FROM stats_counters WHERE metric IN %s AND bucket = %s", (metrics, str(user_id)))
+        return
+    try:
+        with _stats_lock:
+            db.table('stats').remove(Query().metric.one_of(list(metrics)) & (Query().bucket == str(user_id)))
+    except Exception as e:
+        logging.error(f"TinyDB stats backup error: {e}")
+
+def rebuild_stats(cur):
+    """Recompute every Postgres counter from the source tables (one-off backfill)"""
+    cur.execute("DELETE FROM stats_counters")
+    cur.execute(f"""
+        INSERT INTO stats_counters (metric, bucket, value)
+        SELECT 'messages_by_user', user_id::text, COUNT(*) FROM messages GROUP BY user_id
+        UNION ALL
+        SELECT 'messages_by_day', COALESCE(to_char(timestamp::date, 'YYYY-MM-DD'), 'unknown') || '#' || (user_id % {STATS_SHARDS}), COUNT(*) FROM messages GROUP BY 2
+        UNION ALL
+        SELECT 'messages_by_provider', COALESCE(provider, 'unknown') || '#' || (user_id % {STATS_SHARDS}), COUNT(*) FROM messages GROUP BY 2
+        UNION ALL
+        SELECT 'diary_notes', user_id::text, jsonb_array_length(notes) FROM diary WHERE jsonb_typeof(notes) = 'array'
+        UNION ALL
+        SELECT 'submissions', 'total', COUNT(*) FROM game_submissions
+    """)
+    set_stats([("music_files", "total", len(list_music_files()))], cur)
+
+def rebuild_local_stats():
+    """Recompute the TinyDB counters from the TinyDB tables"""
+    groups = {}
+    for m in db.table('messages').all():
+        if not isinstance(m.get('user_id'), int): continue
+        key = (m.get('user_id'), (m.get('timestamp') or 'unknown')[:10], m.get('provider') or 'unknown')
+        groups[key] = groups.get(key, 0) + 1
+    totals = {}
+    for (user_id, day, provider), count in groups.items():
+        for metric, bucket, value in message_stats(user_id, [(day, provider, count)]):
+            totals[(metric, str(bucket))] = totals.get((metric, str(bucket)), 0) + value
+    rows = [(metric, bucket, value) for (metric, bucket), value in totals.items()]
+    rows += [("diary_notes", d['user_id'], len(d.get('notes') or [])) for d in db.table('diary').all()]
+    rows += [("submissions", "total", len(db.table('game_submissions'))), ("music_files", "total", len(list_music_files()))]
+    with _stats_lock:
+        db.table('stats').truncate()
+    set_stats(rows)
+
+def sync_music_stats():
+    """Music lives on disk, so its counter is refreshed after each upload/delete"""
+    rows = [("music_files", "total", len(list_music_files()))]
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn.cursor() as cur:
+                set_stats(rows, cur)
+                conn.commit()
+        except Exception as e:
+            logging.error(f"Database stats save error: {e}")
+        finally: conn.close()
+    set_stats(rows)
+
+def get_stats(days=30):
+    """Read the counters back as {metric: {bucket: value}}, summing shards and keeping only the last `days` days"""
+    since = (date.today() - timedelta(days=days)).isoformat()
+    rows = None
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT metric, split_part(bucket, '#', 1), SUM(value) FROM stats_counters "
+                    "WHERE metric <> 'messages_by_day' OR split_part(bucket, '#', 1) > %s GROUP BY 1, 2",
+                    (since,)
+                )
+                rows = cur.fetchall()
+        except Exception as e:
+            logging.error(f"Database stats retrieval error: {e}")
+        finally: conn.close()
+    if rows is None:
+        rows = [(r['metric'], r['bucket'].split('#')[0], r['value']) for r in db.table('stats').all()]
+        rows = [r for r in rows if r[0] != 'messages_by_day' or r[1] > since]
+    stats = {}
+    for metric, bucket, value in rows:
+        stats.setdefault(metric, {})
+        stats[metric][bucket] = stats[metric].get(bucket, 0) + value
+    return stats
+
+def get_db_size():
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_database_size(current_database())")
+                return cur.fetchone()[0]
+        except Exception as e:
+            logging.error(f"Database size retrieval error: {e}")
+        finally: conn.close()
+    try:
+        return os.path.getsize('db.json')
+    except OSError:
+        return 0
+
+def ensure_messages_partitioned(cur):
+    """Create `messages` hash-partitioned by user_id, migrating a legacy flat table in place"""
+    cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages')")
+    if cur.fetchone(): return
+    cur.execute("SELECT to_regclass('messages') IS NOT NULL")
+    legacy = cur.fetchone()[0]
+    if legacy:
+        logging.info("Migrating messages table to per-user hash partitions...")
+        cur.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    cur.execute(
+        "CREATE TABLE messages (id BIGSERIAL, user_id BIGINT NOT NULL, message TEXT, response TEXT, provider TEXT, "
+        "timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (user_id, id)) PARTITION BY HASH (user_id)"
+    )
+    for i in range(MESSAGE_PARTITIONS):
+        cur.execute(f"CREATE TABLE messages_p{i} PARTITION OF messages FOR VALUES WITH (MODULUS {MESSAGE_PARTITIONS}, REMAINDER {i})")
+    cur.execute("CREATE INDEX messages_user_ts_idx ON messages (user_id, timestamp)")
+    if legacy:
+        cur.execute(
+            "INSERT INTO messages (user_id, message, response, timestamp) "
+            "SELECT COALESCE(user_id, %s), message, response, timestamp FROM messages_legacy ORDER BY id",
+            (OWNER_ID,)
+        )
+        cur.execute("DROP TABLE messages_legacy")
+
 def init_db():
     conn = get_db_connection()
     if not conn: 
@@ -118,11 +317,24 @@ def init_db():
         return
     try:
         with conn.cursor() as cur:
+            # Serialise schema setup across gunicorn workers booting at the same time
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('init_db'))")
             cur.execute("CREATE TABLE IF NOT EXISTS users (id BIGINT PRIMARY KEY, memory TEXT, mood TEXT)")
-            cur.execute("CREATE TABLE IF NOT EXISTS messages (id SERIAL PRIMARY KEY, user_id BIGINT, message TEXT, response TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+            ensure_messages_partitioned(cur)
+            cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS provider TEXT")
             cur.execute("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT)")
             cur.execute("CREATE TABLE IF NOT EXISTS diary (user_id BIGINT PRIMARY KEY, notes JSONB, last_ai_line TEXT)")
+            cur.execute("ALTER TABLE diary ADD COLUMN IF NOT EXISTS notes_updated_at TIMESTAMP")
+            cur.execute("ALTER TABLE diary ADD COLUMN IF NOT EXISTS line_generated_at TIMESTAMP")
             cur.execute("CREATE TABLE IF NOT EXISTS game_submissions (id SERIAL PRIMARY KEY, game_type TEXT, content TEXT, file_path TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+            cur.execute("CREATE TABLE IF NOT EXISTS job_runs (id BIGSERIAL PRIMARY KEY, job TEXT, started_at TIMESTAMP, finished_at TIMESTAMP, duration_ms DOUBLE PRECISION, status TEXT, attempt INT, error TEXT, worker TEXT)")
+            cur.execute("CREATE INDEX IF NOT EXISTS job_runs_job_started_idx ON job_runs (job, started_at DESC)")
+            cur.execute("CREATE TABLE IF NOT EXISTS job_requests (job TEXT PRIMARY KEY, requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+            cur.execute("CREATE TABLE IF NOT EXISTS stats_counters (metric TEXT, bucket TEXT, value DOUBLE PRECISION NOT NULL DEFAULT 0, PRIMARY KEY (metric, bucket))")
+            cur.execute("SELECT EXISTS (SELECT 1 FROM stats_counters)")
+            if not cur.fetchone()[0]:
+                logging.info("Backfilling stats counters from existing data...")
+                rebuild_stats(cur)
             conn.commit()
         
         # MANDATORY: Sync memory.json immediately to new DB connection
@@ -142,9 +354,25 @@ def init_db():
             conn.close()
 
 init_db()
+if not len(db.table('stats')):
+    rebuild_local_stats()
 
 MEMORY = load_memory()
 
+# PER-USER LOCKS
+# Fixed pool so memory stays flat however many users are seen; unrelated users
+# sharing a slot only ever wait on each other briefly.
+USER_LOCK_POOL = 64
+_user_locks = [Lock() for _ in range(USER_LOCK_POOL)]
+
+def user_lock(user_id):
+    """In-process lock guarding one user's rows (TinyDB has no locking of its own)"""
+    return _user_locks[hash(user_id) % USER_LOCK_POOL]
+
+def lock_user_row(cur, user_id):
+    """Cross-worker transaction lock on one user, released on commit/rollback"""
+    cur.execute("SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", (f"user:{user_id}",))
+
 # DB HELPERS
 def get_user_data(user_id):
     conn = get_db_connection()
@@ -160,22 +388,56 @@ def get_user_data(user_id):
     return user if user else {"id": user_id, "memory": "", "mood": "loving"}
 
 def update_user_data(user_id, memory, mood):
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("INSERT INTO users (id, memory, mood) VALUES (%s, %s, %s) ON CONFLICT (id) DO UPDATE SET memory = EXCLUDED.memory, mood = EXCLUDED.mood", (user_id, memory, mood))
-                conn.commit()
-        finally: conn.close()
-    db.table('users').upsert({"id": user_id, "memory": memory, "mood": mood}, Users.id == user_id)
+    with user_lock(user_id):
+        conn = get_db_connection()
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    lock_user_row(cur, user_id)
+                    cur.execute("INSERT INTO users (id, memory, mood) VALUES (%s, %s, %s) ON CONFLICT (id) DO UPDATE SET memory = EXCLUDED.memory, mood = EXCLUDED.mood", (user_id, memory, mood))
+                    conn.commit()
+            finally: conn.close()
+        db.table('users').upsert({"id": user_id, "memory": memory, "mood": mood}, Users.id == user_id)
+
+def append_user_memory(user_id, text, mood, max_len=5000):
+    """Append to a user's rolling memory without losing concurrent writes"""
+    with user_lock(user_id):
+        memory = None
+        conn = get_db_connection()
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    lock_user_row(cur, user_id)
+                    cur.execute(
+                        "INSERT INTO users (id, memory, mood) VALUES (%s, RIGHT(%s, %s), %s) "
+                        "ON CONFLICT (id) DO UPDATE SET memory = RIGHT(COALESCE(users.memory, '') || EXCLUDED.memory, %s), mood = EXCLUDED.mood "
+                        "RETURNING memory",
+                        (user_id, text, max_len, mood, max_len)
+                    )
+                    memory = cur.fetchone()[0]
+                    conn.commit()
+            except Exception as e:
+                logging.error(f"Database memory append error: {e}")
+            finally: conn.close()
+        if memory is None:
+            user = db.table('users').get(Users.id == user_id)
+            memory = ((user.get('memory') or "") if user else "") + text
+            memory = memory[-max_len:]
+        db.table('users').upsert({"id": user_id, "memory": memory, "mood": mood}, Users.id == user_id)
 
-def save_message(user_id, msg, response):
-    timestamp = datetime.now().isoformat()
+def save_message(user_id, msg, response, provider=None, latency_ms=None):
+    now = datetime.now()
+    timestamp = now.isoformat()
+    stats = message_stats(user_id, [(now.date().isoformat(), provider, 1)])
+    if latency_ms is not None:
+        stats += [("reply_latency_ms", stats_shard("sum", user_id), latency_ms), ("reply_latency_ms", stats_shard("count", user_id), 1)]
     conn = get_db_connection()
     if conn:
         try:
             with conn.cursor() as cur:
-                cur.execute("INSERT INTO messages (user_id, message, response) VALUES (%s, %s, %s)", (user_id, msg, response))
+                # Explicit timestamp so the day bucket and the row agree whatever the server timezone
+                cur.execute("INSERT INTO messages (user_id, message, response, provider, timestamp) VALUES (%s, %s, %s, %s, %s)", (user_id, msg, response, provider, now))
+                bump_stats(stats, cur)
                 conn.commit()
                 logging.info(f"Message saved to PostgreSQL for user {user_id}")
         except Exception as e:
@@ -188,8 +450,10 @@ def save_message(user_id, msg, response):
             'user_id': user_id,
             'message': msg,
             'response': response,
+            'provider': provider,
             'timestamp': timestamp
         })
+        bump_stats(stats)
         logging.info(f"Message backed up to TinyDB for user {user_id}")
     except Exception as e:
         logging.error(f"TinyDB message backup error: {e}")
@@ -270,11 +534,13 @@ def get_diary(user_id):
     return {"notes": [], "last_ai_line": "Thinking of you... ✨"}
 
 def update_diary(user_id, notes, last_ai_line):
+    now = datetime.now()
     conn = get_db_connection()
     if conn:
         try:
             with conn.cursor() as cur:
-                cur.execute("INSERT INTO diary (user_id, notes, last_ai_line) VALUES (%s, %s, %s) ON CONFLICT (user_id) DO UPDATE SET notes = EXCLUDED.notes, last_ai_line = EXCLUDED.last_ai_line", (user_id, json.dumps(notes), last_ai_line))
+                cur.execute("INSERT INTO diary (user_id, notes, last_ai_line, notes_updated_at) VALUES (%s, %s, %s, %s) ON CONFLICT (user_id) DO UPDATE SET notes = EXCLUDED.notes, last_ai_line = EXCLUDED.last_ai_line, notes_updated_at = EXCLUDED.notes_updated_at", (user_id, json.dumps(notes), last_ai_line, now))
+                set_stats([("diary_notes", user_id, len(notes))], cur)
                 conn.commit()
                 logging.info(f"Diary saved to PostgreSQL for user {user_id}")
         except Exception as e:
@@ -286,12 +552,86 @@ def update_diary(user_id, notes, last_ai_line):
         db.table('diary').upsert({
             'user_id': user_id,
             'notes': notes,
-            'last_ai_line': last_ai_line
+            'last_ai_line': last_ai_line,
+            'notes_updated_at': now.isoformat()
         }, Query().user_id == user_id)
+        set_stats([("diary_notes", user_id, len(notes))])
         logging.info(f"Diary backed up to TinyDB for user {user_id}")
     except Exception as e:
         logging.error(f"TinyDB diary backup error: {e}")
 
+def delete_message_rows(cur, user_id, cutoff_time=None):
+    """Delete a user's Postgres messages in the caller's transaction, taking them off every message counter"""
+    where, params = "user_id = %s", [user_id]
+    if cutoff_time is not None:
+        where += " AND timestamp < %s"
+        params.append(cutoff_time)
+    cur.execute(
+        f"WITH d AS (DELETE FROM messages WHERE {where} RETURNING timestamp, provider) "
+        "SELECT COALESCE(to_char(timestamp::date, 'YYYY-MM-DD'), 'unknown'), provider, COUNT(*) FROM d GROUP BY 1, 2",
+        params
+    )
+    groups = cur.fetchall()
+    bump_stats(message_stats(user_id, groups, sign=-1), cur)
+    return sum(count for _, _, count in groups)
+
+def delete_local_messages(user_id, cutoff_time=None):
+    """TinyDB counterpart of delete_message_rows"""
+    def is_old(ts):
+        if cutoff_time is None: return True
+        try: return datetime.fromisoformat(ts) < cutoff_time
+        except (TypeError, ValueError): return False
+
+    table = db.table('messages')
+    docs = table.search((Query().user_id == user_id) & Query().timestamp.test(is_old)) if cutoff_time else table.search(Query().user_id == user_id)
+    if not docs: return 0
+    groups = {}
+    for d in docs:
+        key = ((d.get('timestamp') or 'unknown')[:10], d.get('provider'))
+        groups[key] = groups.get(key, 0) + 1
+    table.remove(doc_ids=[d.doc_id for d in docs])
+    bump_stats(message_stats(user_id, [(day, provider, count) for (day, provider), count in groups.items()], sign=-1))
+    return len(docs)
+
+def delete_messages(user_id, cutoff_time=None):
+    """Delete one user's messages, optionally only those older than cutoff_time. Returns rows deleted."""
+    deleted_count = 0
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn.cursor() as cur:
+                deleted_count = delete_message_rows(cur, user_id, cutoff_time)
+                conn.commit()
+        finally: conn.close()
+
+    try:
+        removed = delete_local_messages(user_id, cutoff_time)
+        if not conn: deleted_count = removed
+    except Exception as e:
+        logging.error(f"TinyDB message delete error: {e}")
+    return deleted_count
+
+def clear_user_data(user_id):
+    """Remove every row belonging to one user"""
+    with user_lock(user_id):
+        conn = get_db_connection()
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    lock_user_row(cur, user_id)
+                    delete_message_rows(cur, user_id)
+                    cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+                    cur.execute("DELETE FROM diary WHERE user_id = %s", (user_id,))
+                    drop_user_stats(user_id, cur)
+                    conn.commit()
+            finally: conn.close()
+        try:
+            delete_local_messages(user_id)
+            db.table('users').remove(Query().id == user_id)
+            db.table('diary').remove(Query().user_id == user_id)
+            drop_user_stats(user_id)
+        except: pass
+
 # FLASK APP
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", secrets.token_hex(16))
@@ -301,6 +641,20 @@ def add_header(response):
     response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     return response
 
+def current_user_id():
+    """User the logged-in session belongs to (defaults to the owner's account)"""
+    return session.get("user_id", OWNER_ID)
+
+def parse_user_id(raw):
+    try: return int(raw)
+    except (TypeError, ValueError): return None
+
+def target_user_id():
+    """Admin routes: user_id from the JSON body or query string, else the session's own user"""
+    data = request.get_json(silent=True) or {}
+    user_id = parse_user_id(data.get("user_id", request.args.get("user_id")))
+    return user_id if user_id is not None else current_user_id()
+
 @app.route("/")
 def index():
     if session.get("admin_auth"): return render_template("index.html", user_role="admin")
@@ -309,16 +663,56 @@ def index():
 
 @app.route("/login", methods=["POST"])
 def login():
-    password = get_config('web_password', WEB_PASSWORD)
-    if request.json.get("password") == password:
+    data = request.json or {}
+    user_id = parse_user_id(data.get("user_id"))
+    if user_id is None: user_id = OWNER_ID
+    # Every account needs its own password; the shared one only unlocks the owner's account
+    password = get_config(f'web_password:{user_id}', None)
+    if password is None and user_id == OWNER_ID:
+        password = get_config('web_password', WEB_PASSWORD)
+    if password is not None and data.get("password") == password:
         session["auth"] = True
+        session["user_id"] = user_id
         return jsonify({"success": True})
     return jsonify({"success": False}), 401
 
 @app.route("/chat/history")
 def chat_history():
     if not session.get("auth") and not session.get("admin_auth"): return jsonify([]), 401
-    return jsonify(get_messages(OWNER_ID)[-20:])
+    return jsonify(get_messages(current_user_id(), limit=20))
+
+def time_of_day(hour):
+    return "morning" if 5 <= hour < 12 else "afternoon" if 12 <= hour < 17 else "evening" if 17 <= hour < 21 else "night"
+
+def generate_reply(prompt):
+    """Ask each configured provider in turn until one gives a non-empty reply. Returns (reply, provider), or (None, None)."""
+    try:
+        if AI_CLIENTS["groq"]:
+            try:
+                res = AI_CLIENTS["groq"].chat.completions.create(model="llama-3.3-70b-versatile", messages=[{"role":"system","content":prompt}])
+                reply = (res.choices[0].message.content or "").strip()
+                if reply: return reply, "groq"
+            except Exception as e:
+                logging.error(f"Groq Chat Error: {e}")
+
+        if AI_CLIENTS["gemini"]:
+            try:
+                res = AI_CLIENTS["gemini"].models.generate_content(model="gemini-2.0-flash", contents=prompt)
+                reply = (res.text or "").strip()
+                if reply: return reply, "gemini"
+            except Exception as e:
+                logging.error(f"Gemini Chat Error: {e}")
+
+        if AI_CLIENTS["openai"]:
+            try:
+                res = AI_CLIENTS["openai"].chat.completions.create(model="gpt-3.5-turbo", messages=[{"role":"system","content":prompt}], max_tokens=200)
+                reply = (res.choices[0].message.content or "").strip()
+                if reply: return reply, "openai"
+            except Exception as e:
+                logging.error(f"OpenAI Chat Error: {e}")
+    except Exception as e:
+        logging.error(f"AI ERROR: {e}")
+    return None, None
 
 @app.route("/chat", methods=["POST"])
 def chat():
@@ -329,16 +723,16 @@ def chat():
     if not is_admin and not is_aradhya: 
         return jsonify({"error": "No Auth"}), 401
     
+    user_id = current_user_id()
     msg = request.json.get("message", "")
-    user_data = get_user_data(OWNER_ID)
+    user_data = get_user_data(user_id)
     memory = user_data.get('memory', "")
     
     # Full database history retrieval for total context
-    full_history = get_messages(OWNER_ID, limit=None)
+    full_history = get_messages(user_id, limit=None)
     recent_context = "\n".join([f"U: {m['message']}\nB: {m['response']}" for m in full_history])
     
-    hour = datetime.now().hour
-    time_greeting = "morning" if 5 <= hour < 12 else "afternoon" if 12 <= hour < 17 else "evening" if 17 <= hour < 21 else "night"
+    time_greeting = time_of_day(datetime.now().hour)
     
     # PREFERRED: Use memory.json admin instructions first
     admin_instructions = MEMORY.get("admin_instructions", "You are Jeet 💙, a loving and protective AI.")
@@ -349,7 +743,7 @@ def chat():
         f"MANDATORY RULES:\n"
         f"1. You MUST strictly follow the behavioral rules defined in memory.json.\n"
         f"2. Reference the provided chat history to maintain continuity and avoid repeating mistakes.\n"
-        f"3. Current User ID: {OWNER_ID}\n"
+        f"3. Current User ID: {user_id}\n"
     )
 
     if is_admin:
@@ -358,48 +752,33 @@ def chat():
     else:
         prompt = (f"{system_prompt} It's {time_greeting}. Context: {memory}\n{recent_context}\nHer message: {msg}")
 
-    reply = None
-    try:
-        if AI_CLIENTS["groq"]:
-            try:
-                res = AI_CLIENTS["groq"].chat.completions.create(model="llama-3.3-70b-versatile", messages=[{"role":"system","content":prompt}])
-                reply = res.choices[0].message.content.strip()
-            except Exception as e:
-                logging.error(f"Groq Chat Error: {e}")
+    started = time.monotonic()
+    reply, provider = generate_reply(prompt)
 
-        if not reply and AI_CLIENTS["gemini"]:
-            try:
-                res = AI_CLIENTS["gemini"].models.generate_content(model="gemini-2.0-flash", contents=prompt)
-                reply = res.text.strip()
-            except Exception as e:
-                logging.error(f"Gemini Chat Error: {e}")
-
-        if not reply and AI_CLIENTS["openai"]:
-            try:
-                res = AI_CLIENTS["openai"].chat.completions.create(model="gpt-3.5-turbo", messages=[{"role":"system","content":prompt}], max_tokens=200)
-                reply = res.choices[0].message.content.strip()
-            except Exception as e:
-                logging.error(f"OpenAI Chat Error: {e}")
-    except Exception as e:
-        logging.error(f"AI ERROR: {e}")
-
-    if not reply: reply = "Bubu, signal weak hai... contact Jeet 🐻💖"
+    # Only replies that actually came from a provider count towards latency
+    latency_ms = (time.monotonic() - started) * 1000 if reply else None
+    if not reply:
+        reply = "Bubu, signal weak hai... contact Jeet 🐻💖"
+        provider = "fallback"
     
-    # Always save history for OWNER_ID (Aradhya's account)
-    update_user_data(OWNER_ID, (memory + f"\nU: {msg}\nB: {reply}")[-5000:], "loving")
-    save_message(OWNER_ID, msg, reply)
+    # Always save history for the session's user
+    append_user_memory(user_id, f"\nU: {msg}\nB: {reply}", "loving")
+    save_message(user_id, msg, reply, provider=provider, latency_ms=latency_ms)
     
     return jsonify({"reply": reply})
 
 # DIARY & MUSIC (Simplified)
 @app.route("/diary/get")
 def get_diary_route():
-    return jsonify(get_diary(OWNER_ID)) if (session.get("auth") or session.get("admin_auth")) else (jsonify({}), 401)
+    if not session.get("auth") and not session.get("admin_auth"): return jsonify({}), 401
+    diary = get_diary(current_user_id())
+    # Pre-generated by the greetings job; None until it has run once
+    diary["greeting"] = get_config(f"greeting:{time_of_day(datetime.now().hour)}", None)
+    return jsonify(diary)
 
 @app.route("/music/list")
 def music_list():
-    path = 'static/music'
-    return jsonify([f for f in os.listdir(path) if f.endswith(('.mp3', '.wav', '.m4a', '.ogg'))])
+    return jsonify(list_music_files())
 
 @app.route("/logout", methods=["POST"])
 def logout():
@@ -444,6 +823,7 @@ def admin_music_upload():
     file = request.files.get('file')
     if file:
         file.save(os.path.join(os.path.abspath('static/music'), file.filename))
+        sync_music_stats()
         return jsonify({"success": True})
     return jsonify({"success": False}), 400
 
@@ -453,6 +833,7 @@ def admin_music_delete():
     fname = request.json.get("filename")
     path = os.path.join('static/music', fname)
     if os.path.exists(path): os.remove(path)
+    sync_music_stats()
     return jsonify({"success": True})
 
 @app.route("/admin/memory/get", methods=["GET"])
@@ -470,8 +851,8 @@ def admin_memory_update():
     MEMORY.update(data)
     MEMORY["last_updated"] = datetime.now().isoformat() + "Z"
     if save_memory(MEMORY):
-        # Auto-sync to database for backup and migration
-        sync_memory_to_db()
+        # Backup to database off the request path
+        SCHEDULER.run_now("memory_backup")
         return jsonify({"success": True, "memory": MEMORY})
     return jsonify({"success": False, "error": "Failed to save memory"}), 500
 
@@ -487,8 +868,8 @@ def admin_memory_set():
     MEMORY["admin_instructions"] = instructions
     MEMORY["last_updated"] = datetime.now().isoformat() + "Z"
     if save_memory(MEMORY):
-        # Auto-sync to database
-        sync_memory_to_db()
+        # Backup to database off the request path
+        SCHEDULER.run_now("memory_backup")
         return jsonify({"success": True, "memory": MEMORY})
     return jsonify({"success": False, "error": "Failed to save instructions"}), 500
 
@@ -500,49 +881,81 @@ def admin_users():
     if conn:
         try:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("SELECT id, memory, mood FROM users")
+                # Summary columns only; the full memory is fetched per user via /admin/user/get
+                cur.execute(
+                    "SELECT u.id, u.mood, LEFT(u.memory, 100) AS memory_preview, LENGTH(u.memory) AS memory_length, "
+                    "COALESCE(s.value, 0)::BIGINT AS message_count FROM users u "
+                    "LEFT JOIN stats_counters s ON s.metric = 'messages_by_user' AND s.bucket = u.id::text ORDER BY u.id"
+                )
                 users = [dict(row) for row in cur.fetchall()]
         finally: conn.close()
     return jsonify(users)
 
+@app.route("/admin/user/get", methods=["GET"])
+def admin_user_get():
+    if not session.get("admin_auth"): return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(get_user_data(target_user_id()))
+
+@app.route("/admin/stats", methods=["GET"])
+def admin_stats():
+    if not session.get("admin_auth"): return jsonify({"error": "Unauthorized"}), 401
+    stats = get_stats(days=request.args.get("days", 30, type=int))
+    by_user = {k: int(v) for k, v in stats.get("messages_by_user", {}).items()}
+    diary_notes = {k: int(v) for k, v in stats.get("diary_notes", {}).items()}
+    latency = stats.get("reply_latency_ms", {})
+    return jsonify({
+        "messages": {
+            "total": sum(by_user.values()),
+            "by_user": by_user,
+            "by_day": {k: int(v) for k, v in sorted(stats.get("messages_by_day", {}).items())},
+            "by_provider": {k: int(v) for k, v in stats.get("messages_by_provider", {}).items()},
+        },
+        "avg_reply_latency_ms": round(latency["sum"] / latency["count"], 1) if latency.get("count") else None,
+        "diary_notes": {"total": sum(diary_notes.values()), "by_user": diary_notes},
+        "submissions": int(stats.get("submissions", {}).get("total", 0)),
+        "music_files": int(stats.get("music_files", {}).get("total", 0)),
+        "db_size_bytes": get_db_size(),
+    })
+
 @app.route("/admin/music/list", methods=["GET"])
 def admin_music_list():
     if not session.get("admin_auth"): return jsonify({"error": "Unauthorized"}), 401
-    path = 'static/music'
-    files = [f for f in os.listdir(path) if f.endswith(('.mp3', '.wav', '.m4a', '.ogg'))]
-    return jsonify(files)
+    return jsonify(list_music_files())
 
 @app.route("/admin/diary", methods=["GET"])
 def admin_diary():
     if not session.get("admin_auth"): return jsonify({"error": "Unauthorized"}), 401
-    return jsonify(get_diary(OWNER_ID))
+    return jsonify(get_diary(target_user_id()))
 
 @app.route("/admin/diary/delete", methods=["POST"])
 def admin_diary_delete():
     if not session.get("admin_auth"): return jsonify({"success": False}), 401
+    user_id = target_user_id()
     conn = get_db_connection()
     if conn:
         try:
             with conn.cursor() as cur:
-                cur.execute("DELETE FROM diary WHERE user_id = %s", (OWNER_ID,))
+                cur.execute("DELETE FROM diary WHERE user_id = %s", (user_id,))
+                set_stats([("diary_notes", user_id, 0)], cur)
                 conn.commit()
         finally: conn.close()
     try:
-        db.table('diary').remove(Query().user_id == OWNER_ID)
+        db.table('diary').remove(Query().user_id == user_id)
+        set_stats([("diary_notes", user_id, 0)])
     except: pass
     return jsonify({"success": True})
 
 @app.route("/admin/user/delete", methods=["POST"])
 def admin_user_delete():
     if not session.get("admin_auth"): return jsonify({"success": False}), 401
-    user_id = request.json.get("user_id", OWNER_ID)
+    # repair_clear_user reads the target user_id from the same request body
     return repair_clear_user()
 
 @app.route("/admin/user/update", methods=["POST"])
 def admin_user_update():
     if not session.get("admin_auth"): return jsonify({"success": False}), 401
     data = request.json
-    user_id = data.get("user_id", OWNER_ID)
+    user_id = target_user_id()
     memory = data.get("memory", "")
     mood = data.get("mood", "loving")
     update_user_data(user_id, memory, mood)
@@ -553,8 +966,9 @@ def admin_update_password():
     if not session.get("admin_auth"): return jsonify({"success": False}), 401
     data = request.json
     new_password = data.get("new_password")
+    user_id = parse_user_id(data.get("user_id"))
     if new_password:
-        set_config('web_password', new_password)
+        set_config(f'web_password:{user_id}' if user_id is not None else 'web_password', new_password)
         return jsonify({"success": True})
     return jsonify({"success": False}), 400
 
@@ -562,31 +976,17 @@ def admin_update_password():
 def repair_clear_user():
     if not session.get("admin_auth"): return jsonify({"success": False, "error": "Unauthorized"}), 401
     
-    user_id = OWNER_ID
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("DELETE FROM messages WHERE user_id = %s", (user_id,))
-                cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
-                cur.execute("DELETE FROM diary WHERE user_id = %s", (user_id,))
-                conn.commit()
-        except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
-        finally:
-            conn.close()
-    
+    user_id = target_user_id()
     try:
-        db.table('messages').remove(Query().user_id == user_id)
-        db.table('users').remove(Query().id == user_id)
-        db.table('diary').remove(Query().user_id == user_id)
-    except: pass
+        clear_user_data(user_id)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
     return jsonify({"success": True})
 
 @app.route("/repair/history", methods=["GET"])
 def repair_history():
     if not session.get("admin_auth"): return jsonify({"error": "Unauthorized"}), 401
-    return jsonify(get_messages(OWNER_ID))
+    return jsonify(get_messages(target_user_id(), limit=request.args.get("limit", type=int)))
 
 @app.route("/upload/game", methods=["POST"])
 def upload_game_file():
@@ -603,10 +1003,12 @@ def upload_game_file():
             try:
                 with conn.cursor() as cur:
                     cur.execute("INSERT INTO game_submissions (game_type, file_path) VALUES (%s, %s)", ("truth_dare", filepath))
+                    bump_stats([("submissions", "total", 1)], cur)
                     conn.commit()
             finally: conn.close()
         
         db.table('game_submissions').insert({'game_type': 'truth_dare', 'file_path': filepath, 'timestamp': datetime.now().isoformat()})
+        bump_stats([("submissions", "total", 1)])
         return jsonify({"success": True, "file": filename})
     return jsonify({"success": False}), 400
 
@@ -622,10 +1024,12 @@ def save_game_submission():
         try:
             with conn.cursor() as cur:
                 cur.execute("INSERT INTO game_submissions (game_type, content) VALUES (%s, %s)", (game_type, content))
+                bump_stats([("submissions", "total", 1)], cur)
                 conn.commit()
         finally: conn.close()
     
     db.table('game_submissions').insert({'game_type': game_type, 'content': content, 'timestamp': datetime.now().isoformat()})
+    bump_stats([("submissions", "total", 1)])
     return jsonify({"success": True})
 
 @app.route("/admin/games/submissions", methods=["GET"])
@@ -654,10 +1058,8 @@ def delete_old_messages():
     
     data = request.json or {}
     range_type = data.get("range", "all")
-    user_id = OWNER_ID
-    deleted_count = 0
+    user_id = target_user_id()
     
-    from datetime import timedelta
     
     # Calculate cutoff time based on range
     if range_type == "all":
@@ -674,39 +1076,192 @@ def delete_old_messages():
     else:
         return jsonify({"success": False, "error": "Invalid range"}), 400
     
-    # Delete from database
+    try:
+        deleted_count = delete_messages(user_id, cutoff_time)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    
+    return jsonify({"success": True, "message": f"✅ Deleted {deleted_count} old messages! Memory is safe 💙"})
+
+# BACKGROUND JOBS
+def record_job_run(run):
+    conn = get_db_connection()
+    if not conn: return  # Local mode runs a single worker, whose in-memory history is enough
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO job_runs (job, started_at, finished_at, duration_ms, status, attempt, error, worker) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                (run["job"], run["started_at"], run["finished_at"], run["duration_ms"], run["status"], run["attempt"], run["error"], run["worker"])
+            )
+            conn.commit()
+    finally: conn.close()
+
+def get_job_runs(per_job=20):
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(
+                    "SELECT job, started_at, finished_at, duration_ms, status, attempt, error, worker FROM "
+                    "(SELECT *, ROW_NUMBER() OVER (PARTITION BY job ORDER BY started_at DESC) AS rn FROM job_runs) r "
+                    "WHERE rn <= %s ORDER BY started_at DESC",
+                    (per_job,)
+                )
+                return [dict(row) for row in cur.fetchall()]
+        except Exception as e:
+            logging.error(f"Database job history retrieval error: {e}")
+        finally: conn.close()
+    return SCHEDULER.history()
+
+def push_job_request(name):
     conn = get_db_connection()
     if conn:
         try:
             with conn.cursor() as cur:
-                if cutoff_time is None:
-                    # Delete all messages
-                    cur.execute("DELETE FROM messages WHERE user_id = %s", (user_id,))
-                else:
-                    # Delete messages older than cutoff
-                    cur.execute("DELETE FROM messages WHERE user_id = %s AND timestamp < %s", (user_id, cutoff_time))
-                deleted_count = cur.rowcount
+                cur.execute("INSERT INTO job_requests (job) VALUES (%s) ON CONFLICT (job) DO NOTHING", (name,))
+                conn.commit()
+                return
+        finally: conn.close()
+    db.table('job_requests').upsert({'job': name}, Query().job == name)
+
+def pop_job_requests():
+    """Claim every pending manual run; only the scheduler leader calls this"""
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM job_requests RETURNING job")
+                names = [row[0] for row in cur.fetchall()]
+                conn.commit()
+                return names
+        finally: conn.close()
+    table = db.table('job_requests')
+    names = [r['job'] for r in table.all()]
+    table.truncate()
+    return names
+
+def get_stale_diary_user_ids(limit):
+    """Diaries whose notes changed since their last_ai_line was generated, oldest change first"""
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT user_id FROM diary WHERE line_generated_at IS NULL OR notes_updated_at > line_generated_at "
+                    "ORDER BY notes_updated_at NULLS FIRST LIMIT %s",
+                    (limit,)
+                )
+                return [row[0] for row in cur.fetchall()]
+        finally: conn.close()
+    stale = [d for d in db.table('diary').all()
+             if not d.get('line_generated_at') or (d.get('notes_updated_at') or '') > d['line_generated_at']]
+    stale.sort(key=lambda d: d.get('notes_updated_at') or '')
+    return [d['user_id'] for d in stale[:limit]]
+
+def set_diary_line(user_id, line, as_of):
+    """Write only last_ai_line, so notes added while the line was being generated are kept.
+    as_of is when the notes were read: a note written after it still marks the diary stale."""
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE diary SET last_ai_line = %s, line_generated_at = %s WHERE user_id = %s", (line, as_of, user_id))
                 conn.commit()
         except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
-        finally:
-            conn.close()
-    
-    # Delete from TinyDB
+            logging.error(f"Database diary line save error: {e}")
+        finally: conn.close()
     try:
-        msgs = db.table('messages').all()
-        for msg in msgs:
-            if cutoff_time is None:
-                db.table('messages').remove(Query().user_id == user_id)
-            else:
-                try:
-                    msg_time = datetime.fromisoformat(msg.get('timestamp', ''))
-                    if msg_time < cutoff_time:
-                        db.table('messages').remove(Query().user_id == user_id)
-                except: pass
-    except: pass
-    
-    return jsonify({"success": True, "message": f"✅ Deleted {deleted_count} old messages! Memory is safe 💙"})
+        db.table('diary').update({'last_ai_line': line, 'line_generated_at': as_of.isoformat()}, Query().user_id == user_id)
+    except Exception as e:
+        logging.error(f"TinyDB diary line backup error: {e}")
+
+SCHEDULER = Scheduler(
+    LeaderElector(
+        get_db_connection,
+        database_configured=lambda: bool(os.environ.get("DATABASE_URL")),
+        name="jeet-scheduler",
+        lock_path=os.environ.get("SCHEDULER_LOCK_FILE"),
+    ),
+    on_run=record_job_run,
+    push_request=push_job_request,
+    pop_requests=pop_job_requests,
+)
+
+@SCHEDULER.job("memory_backup", IntervalTrigger(15 * 60), jitter=60, retries=3, backoff=30)
+def memory_backup_job():
+    if sync_memory_to_db() is False:
+        raise RuntimeError("memory.json backup failed")
+
+@SCHEDULER.job("music_rescan", IntervalTrigger(10 * 60), jitter=30, start_now=True)
+def music_rescan_job():
+    sync_music_stats()
+
+# Only fill the cache at boot when it is empty; otherwise wait for the next slot so
+# deploys and failovers don't each cost four provider calls.
+@SCHEDULER.job("greetings", CronTrigger("0 5,12,17,21 * * *"), jitter=120, retries=2, backoff=60,
+               start_now=get_config("greeting:morning", None) is None)
+def greetings_job():
+    """Refresh one greeting per time of day so /diary/get never waits on a provider"""
+    admin_instructions = load_memory().get("admin_instructions", "You are Jeet 💙, a loving and protective AI.")
+    for slot in ("morning", "afternoon", "evening", "night"):
+        greeting, _ = generate_reply(f"{admin_instructions}\nWrite one short, sweet good {slot} greeting for her. Reply with the greeting only.")
+        if not greeting:
+            raise RuntimeError(f"No provider could generate the {slot} greeting")
+        set_config(f"greeting:{slot}", greeting)
+
+@SCHEDULER.job("diary_lines", IntervalTrigger(30 * 60), jitter=120, retries=2, backoff=60)
+def diary_lines_job():
+    """Pre-generate last_ai_line for diaries whose notes changed, a bounded batch per run"""
+    admin_instructions = load_memory().get("admin_instructions", "You are Jeet 💙, a loving and protective AI.")
+    for user_id in get_stale_diary_user_ids(DIARY_LINES_BATCH):
+        as_of = datetime.now()
+        diary = get_diary(user_id)
+        notes = diary.get("notes") or []
+        recent = "\n".join(str(n.get("text", "")) if isinstance(n, dict) else str(n) for n in notes[-5:])
+        line, _ = generate_reply(
+            f"{admin_instructions}\nHer latest diary notes:\n{recent or '(none yet)'}\n"
+            f"Write one short loving line to show at the top of her diary. Reply with the line only."
+        )
+        if line:
+            set_diary_line(user_id, line, as_of)
+
+if MESSAGE_RETENTION_DAYS > 0:
+    @SCHEDULER.job("message_retention", CronTrigger("30 3 * * *"), jitter=300, retries=2, backoff=300)
+    def message_retention_job():
+        cutoff_time = datetime.now() - timedelta(days=MESSAGE_RETENTION_DAYS)
+        # Counters list every user with messages without scanning the messages table
+        for bucket, count in get_stats(days=0).get("messages_by_user", {}).items():
+            if count > 0:
+                delete_messages(int(bucket), cutoff_time)
+
+@SCHEDULER.job("job_history_prune", CronTrigger("45 3 * * *"), jitter=300)
+def job_history_prune_job():
+    conn = get_db_connection()
+    if not conn: return
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM job_runs WHERE started_at < NOW() - INTERVAL '14 days'")
+            conn.commit()
+    finally: conn.close()
+
+@app.route("/admin/jobs", methods=["GET"])
+def admin_jobs():
+    if not session.get("admin_auth"): return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({
+        "worker_is_leader": SCHEDULER.is_leader,
+        "jobs": SCHEDULER.status(),
+        "runs": get_job_runs(per_job=request.args.get("limit", 20, type=int)),
+    })
+
+@app.route("/admin/jobs/run", methods=["POST"])
+def admin_jobs_run():
+    if not session.get("admin_auth"): return jsonify({"success": False}), 401
+    if SCHEDULER.run_now((request.json or {}).get("name")):
+        return jsonify({"success": True})
+    return jsonify({"success": False, "error": "Unknown job"}), 404
+
+if SCHEDULER_ENABLED:
+    SCHEDULER.start()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
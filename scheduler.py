@@ -0,0 +1,361 @@
+import os
+import random
+import socket
+import logging
+import traceback
+from collections import deque
+from threading import Thread, Lock, Event
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: no flock, so no process can be elected locally
+    fcntl = None
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# TRIGGERS
+class IntervalTrigger:
+    """Fire every `seconds`"""
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def next_after(self, dt):
+        return dt + timedelta(seconds=self.seconds)
+
+    def __str__(self):
+        return f"every {self.seconds}s"
+
+def _parse_cron_field(field, lo, hi):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = lo, hi
+        elif '-' in part:
+            start, end = map(int, part.split('-'))
+        else:
+            start = int(part)
+            end = hi if step > 1 else start
+        if not (lo <= start <= end <= hi) or step < 1:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronTrigger:
+    """Standard 5-field cron expression (minute hour day-of-month month day-of-week), local time"""
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expr}")
+        self.expr = expr
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        # 0 and 7 both mean Sunday
+        self.weekdays = {d % 7 for d in _parse_cron_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _day_matches(self, dt):
+        dom = dt.day in self.days
+        dow = (dt.weekday() + 1) % 7 in self.weekdays
+        # Like cron: when both day fields are restricted, either one matching is enough
+        if not self.any_day and not self.any_weekday:
+            return dom or dow
+        return dom and dow
+
+    def next_after(self, dt):
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression never fires: {self.expr}")
+
+    def __str__(self):
+        return f"cron '{self.expr}'"
+
+# LEADER ELECTION
+class LeaderElector:
+    """Elects one process to run scheduled jobs.
+
+    Holds a session-level Postgres advisory lock on a dedicated connection when
+    a database is configured, otherwise an exclusive flock on a local file. The
+    file lock is never used as a stand-in for an unreachable database, since
+    another worker may still hold the advisory lock.
+    """
+    def __init__(self, get_connection, database_configured, name="scheduler", lock_path=None):
+        self.get_connection = get_connection
+        self.database_configured = database_configured
+        self.name = name
+        self.lock_path = lock_path or os.path.join("/tmp", f"{name}.lock")
+        self._conn = None
+        self._file = None
+
+    @property
+    def backend(self):
+        if self._conn: return "postgres"
+        if self._file: return "file"
+        return None
+
+    def acquire(self):
+        """Try to become (or confirm still being) the leader. Safe to call every tick."""
+        if self._conn:
+            try:
+                with self._conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                return True
+            except Exception as e:
+                logging.warning(f"Scheduler lost its leader connection: {e}")
+                self.release()
+
+        use_database = self.database_configured()
+        if self._file:
+            if not use_database:
+                return True
+            # A database was configured since the file lock was taken: compete for the advisory lock instead
+            self.release()
+
+        if use_database:
+            conn = self.get_connection()
+            if not conn:
+                return False  # Unreachable for now; retried at the next election
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_lock(hashtextextended(%s, 0))", (f"scheduler:{self.name}",))
+                    if cur.fetchone()[0]:
+                        self._conn = conn
+                        return True
+            except Exception as e:
+                logging.error(f"Scheduler advisory lock error: {e}")
+            conn.close()
+            return False
+
+        if fcntl is None:
+            return False
+        f = open(self.lock_path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._file = f
+            return True
+        except OSError:
+            f.close()
+            return False
+
+    def release(self):
+        if self._conn:
+            try: self._conn.close()
+            except Exception: pass
+            self._conn = None
+        if self._file:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+                self._file.close()
+            except Exception: pass
+            self._file = None
+
+# JOBS
+class Job:
+    def __init__(self, name, func, trigger, jitter=0, retries=0, backoff=30, start_now=False):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter = jitter
+        self.retries = retries
+        self.backoff = backoff
+        self.start_now = start_now
+        self.next_run = None
+        self.attempt = 0
+        self.running = False
+        self.requested = False
+
+    def schedule_next(self, now):
+        self.next_run = self.trigger.next_after(now) + timedelta(seconds=random.uniform(0, self.jitter))
+
+class Scheduler:
+    """Runs registered jobs on the elected leader only, each in its own thread.
+
+    A job that is still running when it next falls due is skipped rather than
+    started twice; a failing job is retried with exponential backoff before
+    falling back to its normal trigger. Every run is kept in a short in-memory
+    history and handed to `on_run` so it can be persisted.
+
+    Manual runs go through `push_request`/`pop_requests`, a queue shared by all
+    workers that only the leader drains, so they get the same overlap
+    protection and retries as scheduled runs.
+    """
+    def __init__(self, elector, tick=1.0, elect_every=15.0, poll_every=5.0, history_size=50, on_run=None,
+                 push_request=None, pop_requests=None):
+        self.elector = elector
+        self.tick = tick
+        # Election and request polling hit the DB, so they run far less often than the tick
+        self.elect_every = elect_every
+        self.poll_every = poll_every
+        self._elected_at = None
+        self._polled_at = None
+        self.push_request = push_request
+        self.pop_requests = pop_requests
+        self.on_run = on_run
+        self.jobs = {}
+        self.is_leader = False
+        self._history = deque(maxlen=history_size)
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+
+    def add_job(self, name, func, trigger, jitter=0, retries=0, backoff=30, start_now=False):
+        """Register a job; with start_now it also runs as soon as a leader is elected"""
+        job = Job(name, func, trigger, jitter=jitter, retries=retries, backoff=backoff, start_now=start_now)
+        now = datetime.now()
+        if start_now:
+            job.next_run = now + timedelta(seconds=random.uniform(0, job.jitter))
+        else:
+            job.schedule_next(now)
+        self.jobs[name] = job
+        return job
+
+    def job(self, name, trigger, **kwargs):
+        """Decorator form of add_job"""
+        def decorator(func):
+            self.add_job(name, func, trigger, **kwargs)
+            return func
+        return decorator
+
+    def run_now(self, name):
+        """Ask the leader to run a job as soon as possible.
+
+        If this process's scheduler isn't running (e.g. disabled), nothing here
+        would drain the queue, so the job runs locally instead, still off the
+        caller's thread.
+        """
+        job = self.jobs.get(name)
+        if not job: return False
+        if not (self._thread and self._thread.is_alive()):
+            self._dispatch(job, datetime.now())
+        elif self.push_request:
+            self.push_request(name)
+        else:
+            job.requested = True
+        return True
+
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+        logging.info(f"Scheduler started in worker {WORKER_ID} with {len(self.jobs)} jobs")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join(timeout=5)
+        self.elector.release()
+        self.is_leader = False
+        self._elected_at = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                now = datetime.now()
+                if self._elected_at is None or (now - self._elected_at).total_seconds() >= self.elect_every:
+                    self._elected_at = now
+                    was_leader = self.is_leader
+                    self.is_leader = self.elector.acquire()
+                    if self.is_leader and not was_leader:
+                        logging.info(f"Worker {WORKER_ID} is now the scheduler leader ({self.elector.backend})")
+                        self._take_over(now)
+                if not self.is_leader:
+                    self._stop.wait(self.tick)
+                    continue
+                if self.pop_requests and (self._polled_at is None or (now - self._polled_at).total_seconds() >= self.poll_every):
+                    self._polled_at = now
+                    for name in self.pop_requests():
+                        if name in self.jobs: self.jobs[name].requested = True
+                for job in list(self.jobs.values()):
+                    if job.requested:
+                        job.requested = False
+                        self._dispatch(job, now)
+                    elif job.next_run <= now:
+                        self._dispatch(job, now)
+            except Exception as e:
+                logging.error(f"Scheduler loop error: {e}")
+            self._stop.wait(self.tick)
+
+    def _take_over(self, now):
+        """Followers never advance next_run, so re-anchor the triggers when leadership arrives.
+        Without this every job that fell due while another worker led would fire at once."""
+        for job in self.jobs.values():
+            if not job.start_now:
+                job.schedule_next(now)
+            job.attempt = 0
+
+    def _dispatch(self, job, now):
+        with self._lock:
+            if job.running:
+                job.schedule_next(now)
+                self._record(job, now, now, "skipped", "Previous run still in progress")
+                return
+            job.running = True
+        # Provisional slot so the loop doesn't re-dispatch while the job runs
+        job.schedule_next(now)
+        Thread(target=self._run, args=(job,), name=f"job-{job.name}", daemon=True).start()
+
+    def _run(self, job):
+        started = datetime.now()
+        try:
+            job.func()
+            self._record(job, started, datetime.now(), "success")
+            job.attempt = 0
+        except Exception as e:
+            logging.error(f"Job {job.name} failed (attempt {job.attempt + 1}): {e}")
+            self._record(job, started, datetime.now(), "failed", traceback.format_exc(limit=5))
+            if job.attempt < job.retries:
+                delay = job.backoff * 2 ** job.attempt
+                job.attempt += 1
+                job.next_run = datetime.now() + timedelta(seconds=delay)
+            else:
+                job.attempt = 0
+        finally:
+            with self._lock:
+                job.running = False
+
+    def _record(self, job, started, finished, status, error=None):
+        run = {
+            "job": job.name,
+            "started_at": started.isoformat(),
+            "finished_at": finished.isoformat(),
+            "duration_ms": round((finished - started).total_seconds() * 1000, 1),
+            "status": status,
+            "attempt": job.attempt + 1,
+            "error": error,
+            "worker": WORKER_ID,
+        }
+        self._history.append(run)
+        if self.on_run:
+            try: self.on_run(run)
+            except Exception as e: logging.error(f"Job history save error: {e}")
+
+    def history(self, name=None):
+        return [r for r in reversed(self._history) if name is None or r["job"] == name]
+
+    def status(self):
+        return [{
+            "name": job.name,
+            "trigger": str(job.trigger),
+            "next_run": job.next_run.isoformat() if job.next_run and self.is_leader else None,
+            "running": job.running,
+            "retries": job.retries,
+        } for job in self.jobs.values()]